@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
 import sys
+import gc
 import re
 import argparse
 import csv
+from operator import itemgetter
 from reportlab.platypus import SimpleDocTemplate, PageBreak, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.rl_config import defaultPageSize
@@ -20,28 +22,26 @@ DELIVERY_DAY_NO_PREFERENCE_STR = "Indifférent"
 
 PRODUCT_PRICE_PATTERN = re.compile(r'\s*(?P<product>.+)\s*-\s*(?P<price>[0-9,]+)€\s*/\s*(?P<unit>\w+)\s*')
 
+# Buffer size used for file I/O
+IO_BUFFER_SIZE = 1024 * 1024
+
+# Parameters related to text output
+TEXT_CLIENT_SEPARATOR = '-----------------------------------------------------------'
+TEXT_HARVEST_TITLE = '----------- Produits à récolter --------------------'
+TEXT_NOT_ORDERED_TITLE = '\n----------- Produits sans commande --------------------'
+
 # Parameters related to PDF generation
 PAGE_HEIGHT=defaultPageSize[1]
 PAGE_WIDTH=defaultPageSize[0]
 PAGE_MAX_PRODUCT_LINES = 35
+PAGE_FOOTER_FONT = ('Times-Roman', 9)
 
-# Singleton decorator definition
-def singleton(cls):
-    instances = {}
 
-    def getinstance():
-        if cls not in instances:
-            instances[cls] = cls()
-        return instances[cls]
-    return getinstance
-
-@singleton
 class GlobalParams:
     def __init__(self):
         self.delivery_day = False
         self.verbose = False
 
-@singleton
 class PDFParams:
     def __init__(self):
         self.doc = None
@@ -52,98 +52,81 @@ class PDFParams:
         self.subtitle_style = None
         self.table_style = None
         self.table_title_style = None
+        self.client_table_header = None
+        self.harvest_table_header = None
+        self.not_ordered_table_header = None
+        self.summary_table_header = None
+        self.suspect_table_header = None
         self.title_style = None
         self.total_style = None
 
-@singleton
 class TextFileParams:
     def __init__(self):
         self.file = None
 
 
+global_params = GlobalParams()
+pdf_params = PDFParams()
+file_params = TextFileParams()
+
+
 class Product():
-    def __init__(self, price, unit):
-        self.price = float(re.sub(',', '.', price))
+    __slots__ = ('name', 'price', 'price_unit', 'ordered_quantity')
+
+    def __init__(self, name, price, unit):
+        self.name = name
+        self.price = price
         self.price_unit = unit
         self.ordered_quantity = 0
 
     def get_ordered_quantity(self):
         return round(self.ordered_quantity,2)
 
-    def get_price(self):
-        return self.price
-
-    def get_price_unit(self):
-        return self.price_unit
-
     def increase_quantity(self, quantity):
         self.ordered_quantity += quantity
 
 
+# A product ordered by a client: name, unit and unit price are those of the (shared) Product
 class ProductOrder():
-    def __init__(self, name):
-        self.name = name
+    __slots__ = ('product', 'erroneous_quantity', 'quantity', 'price')
+
+    def __init__(self, product):
+        self.product = product
         self.erroneous_quantity = None
         self.quantity = 0
-        self.quantity_unit = None
         self.price = 0
 
     def get_name(self):
-        return self.name
-
-    def get_erroneous_quantity(self):
-        return self.erroneous_quantity
-
-    def get_quantity(self):
-        return self.quantity
+        return self.product.name
 
     def get_quantity_unit(self):
-        return self.quantity_unit
+        return self.product.price_unit
 
-    def set_quantity(self, quantity, product_params):
-        self.quantity_unit = product_params.get_price_unit()
+    def set_quantity(self, quantity):
         # Sometimes clients mix grammes and kilos... attempt to detect it and fix it
-        self.quantity = float(re.sub(',', '.', quantity))
-        if self.quantity_unit == 'kg' and self.quantity >= 100:
+        self.quantity = float(quantity.replace(',', '.'))
+        if self.product.price_unit == 'kg' and self.quantity >= 100:
             self.erroneous_quantity = self.quantity
             self.quantity = self.quantity / 1000.
-        self.price = product_params.get_price() * self.quantity
+        self.price = self.product.price * self.quantity
         # Return the validated quantity
         return self.quantity
 
-    def total_price(self):
-        return self.price
-
 
 class Client():
+    __slots__ = ('comment', 'day', 'email', 'products', 'total_price')
+
     def __init__(self):
         self.comment = None
         self.day = None
         self.email = None
         self.products = []
-        self.total_price = None
+        self.total_price = 0
 
+    # The client total is updated as products are added
     def add_product(self, product):
         self.products.append(product)
-
-    def get_comment(self):
-        return self.comment
-
-    def get_day(self):
-        return self.day
-
-    def get_email(self):
-        return self.email
-
-    def get_products(self):
-        return self.products
-
-    def get_total_price(self):
-        if self.total_price is None:
-            self.total_price = 0
-            for product in self.products:
-                self.total_price += product.total_price()
-        return self.total_price
+        self.total_price += product.price
 
     def set_comment(self, comment):
         self.comment = comment
@@ -158,7 +141,6 @@ class Client():
 
 
 def debug(msg):
-    global_params = GlobalParams()
     if global_params.logger:
         global_params.logger.debug(u'{}'.format(msg))
     elif global_params.verbose:
@@ -166,7 +148,6 @@ def debug(msg):
 
 
 def info(msg):
-    global_params = GlobalParams()
     if global_params.logger:
         global_params.logger.info(u'{}'.format(msg))
     else:
@@ -174,90 +155,92 @@ def info(msg):
 
 
 def exception_handler(exception_type, exception, traceback, debug_hook=sys.excepthook):
-    global_params = GlobalParams()
     if global_params.verbose:
         debug_hook(exception_type, exception, traceback)
     else:
-        print ("{}: {} (use --verbose for details)".format(exception_type.__name__, exception))
+        print ("{}: {} (use --verbose for details)".format(exception_type.__name__, exception), file=sys.stderr)
 
 
 def text_file_init(output_file):
-    file_params = TextFileParams()
     if output_file is None:
         file_params.file = sys.stdout
     else:
-        file_params.file = open(output_file, 'w', encoding='utf-8')
+        file_params.file = open(output_file, 'w', encoding='utf-8', buffering=IO_BUFFER_SIZE)
+
+
+def text_file_close():
+    if file_params.file is None:
+        return
+    if file_params.file is sys.stdout:
+        file_params.file.flush()
+    else:
+        file_params.file.close()
+    file_params.file = None
+
 
 def write_client_orders(output_file, orders):
-    file_params = TextFileParams()
     if file_params.file is None:
         text_file_init(output_file)
+    write = file_params.file.write
 
-    for client_name,client in sorted(orders.items()):
-        client_email = client.get_email()
+    # Lines for one client are collected and written at once
+    for client_name,client in orders:
+        client_email = client.email
 
         if client_email is None:
             client_email = "email non spécifié"
 
-        suspect_quantities = []
-        print('-----------------------------------------------------------', file=file_params.file)
-        print("Commande pour {} ({})".format(client_name, client_email), file=file_params.file)
-        for product in client.get_products():
-            print('{}: {} {}\t({:.2f}€)'.format(product.get_name(),
-                                                product.get_quantity(),
-                                                product.get_quantity_unit(),
-                                                product.total_price()), file=file_params.file)
-            if product.get_erroneous_quantity() is not None:
-                suspect_quantities.append((product))
+        lines = [TEXT_CLIENT_SEPARATOR, f"Commande pour {client_name} ({client_email})"]
+        lines.extend([f'{product.get_name()}: {product.quantity} {product.get_quantity_unit()}'
+                      f'\t({product.price:.2f}€)' for product in client.products])
+        suspect_quantities = [product for product in client.products if product.erroneous_quantity is not None]
 
-        if client.get_comment():
-            print("\nCommentaire de {} :".format(client_name), file=file_params.file)
-            print(client.get_comment(), file=file_params.file)
+        if client.comment:
+            lines.append(f"\nCommentaire de {client_name} :")
+            lines.append(client.comment)
 
         if len(suspect_quantities) > 0:
-            print("\nQuantité suspecte corrigée pour les produits suivants :", file=file_params.file)
+            lines.append("\nQuantité suspecte corrigée pour les produits suivants :")
             for product in suspect_quantities:
-                print("{} : {} {} au lieu de {} {}".format(product.get_name(),
-                                                           product.get_quantity(), product.get_quantity_unit(),
-                                                           product.get_erroneous_quantity(), product.get_quantity_unit()), file=file_params.file)
+                lines.append(f"{product.get_name()} : {product.quantity} {product.get_quantity_unit()}"
+                             f" au lieu de {product.erroneous_quantity} {product.get_quantity_unit()}")
 
-        print("\nPrix total = {:.2f}€".format(client.get_total_price()), file=file_params.file)
-        print('-----------------------------------------------------------', file=file_params.file)
-        print(file=file_params.file)
+        lines.append(f"\nPrix total = {client.total_price:.2f}€")
+        lines.append(TEXT_CLIENT_SEPARATOR)
+        lines.append('')
+        write('\n'.join(lines) + '\n')
 
 
 def write_harvest_quantity(output_file, harvest_products):
-    file_params = TextFileParams()
     if file_params.file is None:
         text_file_init(output_file)
+    write = file_params.file.write
 
     products_not_ordered = []
-    print('----------- Produits à récolter --------------------', file=file_params.file)
+    lines = [TEXT_HARVEST_TITLE]
     for name, product in harvest_products.items():
-        if product.get_ordered_quantity() > 0:
-            print("{}: {} {}\t({:.2f}€/{})".format(name,
-                                                   product.get_ordered_quantity(),
-                                                   product.get_price_unit(),
-                                                   product.get_price(),
-                                                   product.get_price_unit()), file=file_params.file)
+        ordered_quantity = product.get_ordered_quantity()
+        if ordered_quantity > 0:
+            lines.append(f"{name}: {ordered_quantity} {product.price_unit}"
+                         f"\t({product.price:.2f}€/{product.price_unit})")
         else:
             products_not_ordered.append(name)
 
     if len(products_not_ordered) > 0:
-        print('\n----------- Produits sans commande --------------------', file=file_params.file)
-        for product_name in products_not_ordered:
-            print(product_name, file=file_params.file)
+        lines.append(TEXT_NOT_ORDERED_TITLE)
+        lines.extend(products_not_ordered)
+
+    write('\n'.join(lines) + '\n')
 
 
 def PDFPageLayout(canvas, doc):
     canvas.saveState()
-    canvas.setFont('Times-Roman',9)
-    canvas.drawString(inch, 0.75 * inch, "Page {}".format(doc.page))
+    canvas.setFont(*PAGE_FOOTER_FONT)
+    canvas.drawString(inch, 0.75 * inch, f"Page {doc.page}")
     canvas.restoreState()
 
 
 def PDFInit(filename):
-    pdf_params = PDFParams()
     pdf_params.doc = SimpleDocTemplate(filename)
 
     styles = getSampleStyleSheet()
@@ -276,21 +259,27 @@ def PDFInit(filename):
     pdf_params.table_title_style = ParagraphStyle(pdf_params.normal_style)
     pdf_params.table_title_style.fontName = pdf_params.title_style.fontName
 
+    # Table header rows are built once and shared by all the tables of the same kind
+    def table_header(*titles):
+        return [[Paragraph(title, style=pdf_params.table_title_style)] for title in titles]
+    pdf_params.client_table_header = table_header("Produit", "Quantité", "Prix")
+    pdf_params.suspect_table_header = table_header("Produit", "Quantité demandée", "Quantité corrigée")
+    pdf_params.harvest_table_header = table_header("Produit", "Quantité", "Prix unitaire")
+    pdf_params.not_ordered_table_header = [Paragraph("Produit", style=pdf_params.table_title_style)]
+    pdf_params.summary_table_header = table_header("Nom", "Somme Dûe")
+
     pdf_params.story = []
 
 
 def client_orders_pdf(filename, orders):
-    pdf_params = PDFParams()
-    global_params = GlobalParams()
-
     if pdf_params.doc is None:
         PDFInit(filename)
     else:
         pdf_params.story.append(PageBreak())
 
     first_client = True
-    for client_name,client in sorted(orders.items()):
-        client_email = client.get_email()
+    for client_name,client in orders:
+        client_email = client.email
         if client_email is None:
             client_email = "non spécifié"
 
@@ -303,7 +292,7 @@ def client_orders_pdf(filename, orders):
         else:
             spacer_lines = 3
         header_total_lines = 4
-        cmd_lines = len(client.get_products()) + spacer_lines + header_total_lines
+        cmd_lines = len(client.products) + spacer_lines + header_total_lines
         if pdf_params.page_lines + cmd_lines > PAGE_MAX_PRODUCT_LINES:
             pdf_params.page_lines = 0
             pdf_params.story.append(PageBreak())
@@ -312,45 +301,41 @@ def client_orders_pdf(filename, orders):
         first_client = False
         pdf_params.page_lines += cmd_lines
 
-        pdf_params.story.append(Paragraph("Commande de {}".format(client_name), pdf_params.title_style))
-        pdf_params.story.append(Paragraph("Email : {}".format(client_email), pdf_params.email_style))
+        pdf_params.story.append(Paragraph(f"Commande de {client_name}", pdf_params.title_style))
+        pdf_params.story.append(Paragraph(f"Email : {client_email}", pdf_params.email_style))
         if global_params.delivery_day:
-            pdf_params.story.append(Paragraph("Jour de livraison : {}".format(client.get_day()), pdf_params.email_style))
+            pdf_params.story.append(Paragraph(f"Jour de livraison : {client.day}", pdf_params.email_style))
         pdf_params.story.append(Spacer(1, 0.2 * inch))
 
         suspect_quantities = []
-        product_table = [[[Paragraph("Produit", style=pdf_params.table_title_style)],
-                          [Paragraph("Quantité", style=pdf_params.table_title_style)],
-                          [Paragraph("Prix", style=pdf_params.table_title_style)]]]
-        for product in client.get_products():
+        product_table = [pdf_params.client_table_header]
+        for product in client.products:
             product_table.append([product.get_name(),
-                                  '{} {}'.format(product.get_quantity(), product.get_quantity_unit()),
-                                  '{:.2f}€'.format(product.total_price())])
-            if product.get_erroneous_quantity() is not None:
+                                  f'{product.quantity} {product.get_quantity_unit()}',
+                                  f'{product.price:.2f}€'])
+            if product.erroneous_quantity is not None:
                 suspect_quantities.append((product))
         pdf_params.story.append(Table(product_table, style=pdf_params.table_style))
 
-        total_line = "\nPrix total pour {} = {:.2f}€".format(client_name, client.get_total_price())
+        total_line = f"\nPrix total pour {client_name} = {client.total_price:.2f}€"
         pdf_params.story.append(Spacer(1, 0.2 * inch))
         pdf_params.story.append(Paragraph(total_line, pdf_params.total_style))
 
-        if client.get_comment():
+        if client.comment:
             pdf_params.story.append(Spacer(1, 0.2 * inch))
-            pdf_params.story.append(Paragraph("\nCommentaire de {} :".format(client_name), pdf_params.total_style))
+            pdf_params.story.append(Paragraph(f"\nCommentaire de {client_name} :", pdf_params.total_style))
             pdf_params.story.append(Spacer(1, 0.1 * inch))
-            pdf_params.story.append(Paragraph(client.get_comment(), pdf_params.normal_style))
+            pdf_params.story.append(Paragraph(client.comment, pdf_params.normal_style))
 
         if len(suspect_quantities) > 0:
             pdf_params.story.append(Spacer(1, 0.2 * inch))
             pdf_params.story.append(Paragraph("\nQuantité suspecte pour les produits suivants :", pdf_params.total_style))
             pdf_params.story.append(Spacer(1, 0.1 * inch))
-            product_table = [[[Paragraph("Produit", style=pdf_params.table_title_style)],
-                              [Paragraph("Quantité demandée", style=pdf_params.table_title_style)],
-                              [Paragraph("Quantité corrigée", style=pdf_params.table_title_style)]]]
+            product_table = [pdf_params.suspect_table_header]
             for product in suspect_quantities:
                 product_table.append([product.get_name(),
-                                      '{} {}'.format(product.get_erroneous_quantity(), product.get_quantity_unit()),
-                                      '{} {}'.format(product.get_quantity(), product.get_quantity_unit())])
+                                      f'{product.erroneous_quantity} {product.get_quantity_unit()}',
+                                      f'{product.quantity} {product.get_quantity_unit()}'])
             pdf_params.story.append(Table(product_table, style=pdf_params.table_style))
             # Update the number of lines used to ensure it is taken into account for the next client
             # It doesn't prevent the suspect product information to be split on next page
@@ -358,9 +343,6 @@ def client_orders_pdf(filename, orders):
 
 
 def harvest_quantity_pdf(filename, harvest_products, delivery_day):
-    pdf_params = PDFParams()
-    global_params = GlobalParams()
-
     if pdf_params.doc is None:
         PDFInit(filename)
     else:
@@ -371,35 +353,29 @@ def harvest_quantity_pdf(filename, harvest_products, delivery_day):
         if delivery_day == DELIVERY_DAY_NO_PREFERENCE_STR:
             page_title += ' - jour de livraison indifférent'
         else:
-            page_title += ' pour le {}'.format(delivery_day)
+            page_title += f' pour le {delivery_day}'
     pdf_params.story.append(Paragraph(page_title, pdf_params.title_style))
 
     products_not_ordered = []
-    product_table = [[[Paragraph("Produit", style=pdf_params.table_title_style)],
-                      [Paragraph("Quantité", style=pdf_params.table_title_style)],
-                      [Paragraph("Prix unitaire", style=pdf_params.table_title_style)]]]
+    product_table = [pdf_params.harvest_table_header]
     for name, product in harvest_products.items():
-        if product.get_ordered_quantity() > 0:
+        ordered_quantity = product.get_ordered_quantity()
+        if ordered_quantity > 0:
             product_table.append([name,
-                                  '{} {}'.format(product.get_ordered_quantity(), product.get_price_unit()),
-                                  '{}€/{}'.format(product.get_price(), product.get_price_unit())])
+                                  f'{ordered_quantity} {product.price_unit}',
+                                  f'{product.price}€/{product.price_unit}'])
         else:
             products_not_ordered.append(name)
     pdf_params.story.append(Table(product_table, style=pdf_params.table_style))
 
-    product_table = [[Paragraph("Produit", style=pdf_params.table_title_style)]]
+    product_table = [pdf_params.not_ordered_table_header]
     if len(products_not_ordered) > 0:
         pdf_params.story.append(Paragraph("Produits sans commande ", pdf_params.subtitle_style))
-        for product_name in products_not_ordered:
-            product_table.append([product_name])
+        product_table.extend([product_name] for product_name in products_not_ordered)
         pdf_params.story.append(Table(product_table, style=pdf_params.table_style))
 
 
-# Must no be called before client_orders_pdf() or the price will be wrong
 def clients_summary_pdf(filename, orders, delivery_day):
-    pdf_params = PDFParams()
-    global_params = GlobalParams()
-
     if pdf_params.doc is None:
         PDFInit(filename)
     else:
@@ -410,28 +386,151 @@ def clients_summary_pdf(filename, orders, delivery_day):
         if delivery_day == DELIVERY_DAY_NO_PREFERENCE_STR:
             page_title += ' - jour de livraison indifférent'
         else:
-            page_title += ' - {}'.format(delivery_day)
+            page_title += f' - {delivery_day}'
     pdf_params.story.append(Paragraph(page_title, pdf_params.title_style))
 
     total_price = 0
-    clients_table = [[[Paragraph("Nom", style=pdf_params.table_title_style)],
-                      [Paragraph("Somme Dûe", style=pdf_params.table_title_style)]]]
-    for client_name,client in sorted(orders.items()):
+    clients_table = [pdf_params.summary_table_header]
+    for client_name,client in orders:
         clients_table.append([client_name,
-                              '{:.2f}€'.format(client.get_total_price())])
-        total_price += client.get_total_price()
+                              f'{client.total_price:.2f}€'])
+        total_price += client.total_price
     pdf_params.story.append(Table(clients_table, style=pdf_params.table_style))
 
-    total_line = "\nMontant total des commandes = {:.2f}€".format(total_price)
+    total_line = f"\nMontant total des commandes = {total_price:.2f}€"
     pdf_params.story.append(Spacer(1, 0.2 * inch))
     pdf_params.story.append(Paragraph(total_line, pdf_params.total_style))
 
 
 def write_pdf_file():
-    pdf_params = PDFParams()
+    # Nothing to write if no section was produced
+    if pdf_params.doc is None:
+        return
     pdf_params.doc.build(pdf_params.story, onFirstPage=PDFPageLayout, onLaterPages=PDFPageLayout)
 
 
+# Read the CSV file and return the client orders and the products to harvest.
+# orders and harvest_products are dict whose key is the delivery day (or '' if the delivery day is not
+# part of the CSV) and the value is:
+#   - orders: the list of (client name, Client) sorted by client name
+#   - harvest_products: a dict whose key is the product name
+def read_orders(csv_file):
+    orders = dict()
+    harvest_products = dict()
+    day_columns = dict()
+    client_list = set()
+    # Last suffix used for each duplicated client name
+    duplicate_names = dict()
+
+    with open(csv_file, 'r', encoding='utf-8', newline='', buffering=IO_BUFFER_SIZE) as csvfile:
+        rows = csv.reader(csvfile, delimiter=';')
+        # Skip the lines preceding the header line (identified by the presence of the name field)
+        for fieldnames in rows:
+            if NAME_FIELD in fieldnames:
+                break
+        else:
+            raise ValueError('Ligne d\'entête non trouvée (colonne {} absente)'.format(NAME_FIELD))
+        # Find the index of the client fields and parse product columns once: for each product column,
+        # product_columns contains a tuple (column index, product name, price, unit).
+        # Columns before the name are ignored.
+        name_idx = fieldnames.index(NAME_FIELD)
+        email_idx = None
+        comment_idx = None
+        day_idx = None
+        product_columns = []
+        for i in range(name_idx + 1, len(fieldnames)):
+            k = fieldnames[i]
+            if k == EMAIL_FIELD:
+                email_idx = i
+            elif k == COMMENT_FIELD:
+                comment_idx = i
+            elif k == DELIVERY_DAY_FIELD:
+                day_idx = i
+            else:
+                m = PRODUCT_PRICE_PATTERN.match(k)
+                if m:
+                    product_name, product_price, product_unit = m.group('product', 'price', 'unit')
+                    product_name = product_name.rstrip()
+                    product_columns.append((i, product_name, float(product_price.replace(',', '.')), product_unit))
+                else:
+                    raise ValueError('Format produit invalide ({})'.format(k))
+        if day_idx is not None:
+            global_params.delivery_day = True
+
+        # All the objects created while reading rows are kept: the garbage collector is disabled meanwhile
+        # to avoid useless collections
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for row in rows:
+                # Ignore empty lines
+                if not row:
+                    continue
+                # Missing trailing fields are considered empty
+                if len(row) < len(fieldnames):
+                    row += [''] * (len(fieldnames) - len(row))
+
+                name = row[name_idx]
+                if name == '':
+                    raise ValueError('Entrée invalide: le nom est vide')
+                name = name.capitalize()
+                if name in client_list:
+                    # Restart from the last suffix used for this name rather than from 2
+                    i = duplicate_names.get(name, 1)
+                    while True:
+                        i += 1
+                        new_name = f'{name} ({i})'
+                        if new_name not in client_list:
+                            break
+                    duplicate_names[name] = i
+                    print(f'Commande déjà existante pour {name}: nouvelle commande au nom de {new_name}')
+                    name = new_name
+                client_list.add(name)
+
+                client = Client()
+                if email_idx is not None and row[email_idx] != "":
+                    client.set_email(row[email_idx])
+                if comment_idx is not None and row[comment_idx] != "":
+                    client.set_comment(row[comment_idx])
+                if day_idx is not None:
+                    client.set_day(row[day_idx])
+                    day_key = client.day
+                else:
+                    day_key = ''
+
+                # Products for a delivery day are created from the header the first time the day is seen.
+                # day_columns contains for each delivery day the list of (column index, Product).
+                columns = day_columns.get(day_key)
+                if columns is None:
+                    day_products = harvest_products[day_key] = {}
+                    for _, product_name, product_price, product_unit in product_columns:
+                        if product_name not in day_products:
+                            day_products[product_name] = Product(product_name, product_price, product_unit)
+                    columns = day_columns[day_key] = [(i, day_products[product_name])
+                                                      for i, product_name, _, _ in product_columns]
+
+                # Create an entry in the product list for each ordered product, keeping the original order of products
+                add_product = client.add_product
+                for i, product in columns:
+                    v = row[i]
+                    if v == '':
+                        continue
+                    product_order = ProductOrder(product)
+                    validated_quantity = product_order.set_quantity(v)
+                    product.increase_quantity(validated_quantity)
+                    add_product(product_order)
+
+                orders.setdefault(day_key, {})[name] = client
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    # Client orders are sorted once for all the outputs
+    orders = {day: sorted(day_orders.items(), key=itemgetter(0)) for day, day_orders in orders.items()}
+
+    return orders, harvest_products
+
+
 def main():
     parser = argparse.ArgumentParser()
     clients = parser.add_mutually_exclusive_group()
@@ -446,7 +545,6 @@ def main():
     parser.add_argument('csv', help='Fichier des commandes Framaform')
     options = parser.parse_args()
 
-    global_params = GlobalParams()
     global_params.verbose = options.verbose
 
     if options.format == 'pdf':
@@ -454,78 +552,10 @@ def main():
     else:
         pdf_output = False
 
-    # orders and harvest_products are dict of dict
-    #   - First dict key is the delivery day (or '' if the delivery day is not part of the CSV)
-    #   - Second dict key is the client name
-    orders = dict()
-    harvest_products = dict()
-    client_list = set()
-
     try:
-        with open(options.csv, 'r', encoding='utf-8') as csvfile:
-            rows = csv.DictReader(csvfile, delimiter=';')
-            while NAME_FIELD not in rows.fieldnames:
-                rows = csv.DictReader(csvfile, delimiter=';')
-            if DELIVERY_DAY_FIELD in rows.fieldnames:
-                global_params.delivery_day = True
-            for row in rows:
-                name = None
-                client = Client()
-                for k,v in row.items():
-                    if name is None:
-                        if k == NAME_FIELD:
-                            if v == '':
-                                raise Exception('Entrée invalide: le nom est vide')
-                            name = v.capitalize()
-                            if name in client_list:
-                                i = 1
-                                while True:
-                                    i += 1
-                                    new_name = f'{name} ({i})'
-                                    if new_name not in client_list:
-                                        break
-                                print(f'Commande déjà existante pour {name}: nouvelle commande au nom de {new_name}')
-                                name = new_name
-                            client_list.add(name)
-                        continue
-                    elif k == EMAIL_FIELD:
-                        if v != "":
-                            client.set_email(v)
-                        continue
-                    elif k == COMMENT_FIELD:
-                        if v != "":
-                            client.set_comment(v)
-                        continue
-                    elif k == DELIVERY_DAY_FIELD:
-                        client.set_day(v)
-                        continue
-
-                    if global_params.delivery_day:
-                        day_key = client.get_day()
-                    else:
-                        day_key = ''
-
-                    # If the field is a product, create an entry in the product list to keep the original order of products
-                    m = PRODUCT_PRICE_PATTERN.match(k)
-                    if m:
-                        product_name = m.group('product')
-                        product_order = ProductOrder(product_name)
-                    else:
-                        raise Exception('Format produit invalide ({})'.format(k))
-
-                    if day_key not in harvest_products:
-                        harvest_products[day_key] = {}
-                    if product_name not in harvest_products[day_key]:
-                        harvest_products[day_key][product_name] = Product(m.group('price'), m.group('unit'))
-                    if v != '':
-                        validated_quantity = product_order.set_quantity(v, harvest_products[day_key][product_name])
-                        harvest_products[day_key][product_name].increase_quantity(validated_quantity)
-                        client.add_product(product_order)
-                if day_key not in orders:
-                    orders[day_key] = {}
-                orders[day_key][name] = client
-    except:
-        print("Erreur lors du traitement du fichier {}".format(options.csv))
+        orders, harvest_products = read_orders(options.csv)
+    except (OSError, csv.Error, ValueError):
+        print("Erreur lors du traitement du fichier {}".format(options.csv), file=sys.stderr)
         raise
 
     if pdf_output:
@@ -538,12 +568,16 @@ def main():
                 harvest_quantity_pdf(options.output, harvest_products[delivery_day], delivery_day)
         write_pdf_file()
     else:
-        if options.clients:
-            for delivery_day in orders:
-                write_client_orders(options.output, orders[delivery_day])
-        if options.harvest:
-            for delivery_day in orders:
-                write_harvest_quantity(options.output, harvest_products[delivery_day])
+        # The output file is opened by the first writer called
+        try:
+            if options.clients:
+                for delivery_day in orders:
+                    write_client_orders(options.output, orders[delivery_day])
+            if options.harvest:
+                for delivery_day in orders:
+                    write_harvest_quantity(options.output, harvest_products[delivery_day])
+        finally:
+            text_file_close()
 
 
 if __name__ == "__main__":